@@ -0,0 +1,52 @@
+import json
+import time
+from pathlib import Path
+
+from git import Repo
+
+from offal.constants import CACHE_DIRNAME, CACHE_MAX_AGE
+
+
+def get_cache_dir(repo: Repo) -> Path:
+    return Path(repo.working_tree_dir or repo.git_dir) / ".offal" / CACHE_DIRNAME
+
+
+def get_cache_path(repo: Repo, namespace: str, key: str) -> Path:
+    return get_cache_dir(repo) / namespace / f"{key}.json"
+
+
+def read_cache(repo: Repo, namespace: str, key: str):
+    try:
+        return json.loads(get_cache_path(repo, namespace, key).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(repo: Repo, namespace: str, key: str, value) -> None:
+    path = get_cache_path(repo, namespace, key)
+    try:
+        if not path.parent.is_dir():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Cache entries live in the working tree, so keep them out of git status
+            ignore_file = get_cache_dir(repo) / ".gitignore"
+            if not ignore_file.exists():
+                ignore_file.write_text("*\n")
+        # Write to a sibling file first so a concurrent reader never sees a partial entry
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(value))
+        tmp_path.replace(path)
+    except OSError:
+        # The cache is an optimisation only; an unwritable location should not fail the command
+        pass
+
+
+def prune_cache(repo: Repo, namespace: str, max_age: float = CACHE_MAX_AGE) -> None:
+    """Delete entries in namespace that were last written more than max_age seconds ago."""
+    cutoff = time.time() - max_age
+    try:
+        for path in get_cache_path(repo, namespace, "").parent.glob("*.json"):
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+    except OSError:
+        pass
+
@@ -0,0 +1,142 @@
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import typer
+from git import Commit, GitCommandError, InvalidGitRepositoryError, Repo
+
+from offal.cache import read_cache, write_cache
+from offal.pinned import get_pinned_item, split_pin
+
+
+class OffalError(Exception):
+    """Base exception for Offal-specific errors."""
+
+
+class FileNotFoundError(OffalError):
+    """Raised when a file is not found in the repository."""
+
+
+class NoCommitHistoryError(OffalError):
+    """Raised when no commit history is found."""
+
+
+# Opened repositories by the directory the search started from, so code that changes directory gets the right one
+_REPOS: Dict[str, Repo] = {}
+
+
+def get_repo() -> Repo:
+    cwd = os.getcwd()
+    repo = _REPOS.get(cwd)
+    if repo is None:
+        try:
+            repo = Repo(search_parent_directories=True)
+        except InvalidGitRepositoryError:
+            raise OffalError("Not a valid git repository.")
+        ensure_commit_graph(repo)
+        _REPOS[cwd] = repo
+    return repo
+
+
+def iter_nul_records(proc, read_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Yield the NUL-separated records of a git process's output as they arrive, then wait for it to exit.
+
+    Empty records are passed through, since some formats use them as delimiters. A non-zero exit status
+    surfaces as GitCommandError once the output is exhausted.
+    """
+    pending = b""
+    for chunk in iter(lambda: proc.stdout.read(read_size), b""):
+        records = (pending + chunk).split(b"\x00")
+        # The last piece is an incomplete record unless the chunk ended exactly on a separator
+        pending = records.pop()
+        yield from records
+    if pending:
+        yield pending
+    proc.wait()
+
+
+@lru_cache(maxsize=4096)
+def get_commit(repo: Repo, hexsha: str) -> Commit:
+    """Resolve a sha to a Commit, reusing the object when the same sha is looked up again."""
+    return repo.commit(hexsha)
+
+
+def read_blob(repo: Repo, rev: str, path: str) -> bytes:
+    """Read a file's contents at rev through the repository's persistent git cat-file --batch process.
+
+    Raises KeyError when path is not a file at rev.
+    """
+    try:
+        _, object_type, _, data = repo.git.get_object_data(f"{rev}:{path}")
+    except ValueError:
+        raise KeyError(path)
+    if object_type != b"blob":
+        raise KeyError(path)
+    return data
+
+
+def ensure_commit_graph(repo: Repo) -> None:
+    """Write a commit-graph with changed-path Bloom filters the first time offal runs in a repository.
+
+    With the filters present, path-limited log walks only open the commits that may touch the path. A graph
+    written by gc or fetch usually lacks them, so it is rewritten once. The attempt is recorded in the cache
+    so a repository where the write fails is not retried on every run.
+    """
+    if has_commit_graph_filters(repo):
+        return
+    if read_cache(repo, "maintenance", "commit-graph") is not None:
+        return
+    typer.echo("Writing a commit-graph to speed up history lookups, which only happens once...", err=True)
+    try:
+        repo.git.commit_graph("write", "--reachable", "--changed-paths")
+    except GitCommandError:
+        pass
+    write_cache(repo, "maintenance", "commit-graph", True)
+
+
+def has_commit_graph_filters(repo: Repo) -> bool:
+    """Check whether every commit-graph file git reads for the repository has changed-path Bloom filters."""
+    # Linked worktrees keep their objects in the main repository's git directory
+    graph_files = get_commit_graph_files(Path(repo.common_dir) / "objects" / "info")
+    return bool(graph_files) and all(has_changed_path_filters(graph_file) for graph_file in graph_files)
+
+
+def get_commit_graph_files(info_dir: Path) -> List[Path]:
+    """Return the commit-graph files git reads: the single file if there is one, else every layer of the chain."""
+    single = info_dir / "commit-graph"
+    if single.is_file():
+        return [single]
+    try:
+        chain = (info_dir / "commit-graphs" / "commit-graph-chain").read_text().split()
+    except OSError:
+        return []
+    return [info_dir / "commit-graphs" / f"graph-{graph_hash}.graph" for graph_hash in chain]
+
+
+def has_changed_path_filters(graph_file: Path) -> bool:
+    """Check the chunk table of a commit-graph file for the Bloom filter index chunk."""
+    try:
+        with graph_file.open("rb") as f:
+            # "CGPH", version, hash version, chunk count, base graph count
+            header = f.read(8)
+            if len(header) < 8 or header[:4] != b"CGPH":
+                return False
+            # Each table entry is a 4-byte chunk id followed by an 8-byte offset
+            table = f.read(12 * header[6])
+    except OSError:
+        return False
+    return any(table[offset:offset + 4] == b"BIDX" for offset in range(0, len(table), 12))
+
+
+def get_file_info(file_path: Optional[str]) -> Tuple[str, Optional[int]]:
+    if not file_path:
+        pinned_item = get_pinned_item("file")
+        if not pinned_item:
+            raise OffalError(
+                "No file is currently pinned. Use 'offal pin file' to pin a file or provide a file path with --file option."
+            )
+        if not isinstance(pinned_item, str):
+            raise OffalError("Invalid pinned item type")
+        return split_pin(pinned_item)
+    return file_path, None
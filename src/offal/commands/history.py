@@ -1,12 +1,20 @@
+import hashlib
+import heapq
+import os
+import re
 import sys
 import termios
 import tty
-from datetime import datetime, timezone
-from typing import Optional, List
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, Optional, List, Tuple
 import git
-from git import Repo, Commit, GitCommandError, InvalidGitRepositoryError, NoSuchPathError
-from dataclasses import dataclass
-from functools import lru_cache
+from git import Repo, Commit, GitCommandError
+from git.repo.base import BlameEntry
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from itertools import islice
+from pathlib import PurePath
 from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
@@ -15,39 +23,53 @@ from rich.syntax import Syntax
 from rich.prompt import Prompt
 import typer
 
-from offal.pinned import get_pinned_item
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+from offal.cache import prune_cache, read_cache, write_cache
+from offal.commands._common import (
+    FileNotFoundError,
+    OffalError,
+    get_commit,
+    get_file_info,
+    get_repo,
+    has_commit_graph_filters,
+    iter_nul_records,
+)
 
 app = typer.Typer()
 console = Console()
 
 
+# Fields are separated by US (0x1f); with -z git terminates each record with a NUL.
+LOG_FORMAT = "--pretty=format:%H%x1f%an%x1f%ae%x1f%cI%x1f%s"
+BLAME_HEADER_RE = re.compile(rb"^([0-9a-f]{40}) (\d+) (\d+) (\d+)$")
+DATE_RE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+(\d+)")
+NO_NEWLINE_MARKER = "\\ No newline at end of file"
+
+
 @dataclass
 class CommitDetails:
-    commit: Commit
+    hexsha: str
     summary: str
     author_name: str
     author_email: str
     date: datetime
+    # Display forms, derived once so repeated renders do not reformat them
+    short_sha: str = field(init=False, repr=False)
+    short_date: str = field(init=False, repr=False)
 
-
-class OffalError(Exception):
-    """Base exception for Offal-specific errors."""
-
-
-class FileNotFoundError(OffalError):
-    """Raised when a file is not found in the repository."""
+    def __post_init__(self):
+        self.short_sha = self.hexsha[:7]
+        self.short_date = f"{self.date.year:04d}-{self.date.month:02d}-{self.date.day:02d}"
 
 
-class NoCommitHistoryError(OffalError):
-    """Raised when no commit history is found."""
-
-
-@lru_cache(maxsize=32)
-def get_repo():
-    try:
-        return Repo(search_parent_directories=True)
-    except InvalidGitRepositoryError:
-        raise OffalError("Not a valid git repository.")
+@lru_cache(maxsize=None)
+def get_pygit2_repo(git_dir: str):
+    return pygit2.Repository(git_dir)
 
 
 def get_revisions(
@@ -58,150 +80,378 @@ def get_revisions(
     author: Optional[str] = None,
     before: Optional[datetime] = None,
     after: Optional[datetime] = None,
-) -> List[Commit]:
+    limit: Optional[int] = None,
+    first_parent: bool = False,
+) -> Iterator[CommitDetails]:
+    """Lazily yield the matching revisions; git is only read as far as the caller iterates."""
+    filters = dict(author=author, before=before, after=after, limit=limit, reverse=reverse, first_parent=first_parent)
     if line_number:
-        revisions = get_line_specific_revisions(repo, file_path, line_number)
+        revisions = get_line_specific_revisions(repo, file_path, line_number, **filters)
     else:
-        revisions = get_file_revisions(repo, file_path)
+        revisions = get_file_revisions(repo, file_path, **filters)
 
-    revisions = filter_revisions(revisions, author, before, after)
-
-    if reverse:
-        revisions.reverse()
+    # A reversed git log cannot take --max-count (see get_log_filter_args), so stop after limit here
+    if reverse and limit is not None:
+        revisions = islice(revisions, limit)
 
     return revisions
 
 
+def get_log_filter_args(
+    author: Optional[str],
+    before: Optional[datetime],
+    after: Optional[datetime],
+    limit: Optional[int],
+    reverse: bool = False,
+    first_parent: bool = False,
+) -> List[str]:
+    """Translate the history filters into git log options so git prunes the walk itself."""
+    args = []
+    if first_parent:
+        args.append("--first-parent")
+    if reverse:
+        # git applies --max-count before --reverse, which would keep the newest commits rather than the
+        # oldest, so the limit is only pushed down for newest-first listings.
+        args.append("--reverse")
+    elif limit is not None:
+        args.append(f"--max-count={limit}")
+    if author:
+        # Case-insensitive substring match on "Name <email>", the same test filter_by_author applies
+        args.extend([f"--author={author}", "--fixed-strings", "--regexp-ignore-case"])
+    if before:
+        args.append(f"--before=@{int(before.timestamp())}")
+    if after:
+        args.append(f"--after=@{int(after.timestamp())}")
+    return args
+
+
 def get_line_specific_revisions(
-    repo: Repo, file_path: str, start_line: int, end_line: Optional[int] = None
-) -> List[Commit]:
-    try:
-        end_line = end_line or start_line
-        # limit_arg = f'-n {limit}'
+    repo: Repo,
+    file_path: str,
+    start_line: int,
+    end_line: Optional[int] = None,
+    rev_range: Optional[str] = None,
+    author: Optional[str] = None,
+    before: Optional[datetime] = None,
+    after: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    reverse: bool = False,
+    first_parent: bool = False,
+) -> Iterator[CommitDetails]:
+    end_line = end_line or start_line
 
-        output = repo.git.log(f"-L {start_line},{end_line}:{file_path}", "--no-patch", '--pretty=format:"%H"')
-        commit_hashes = output.strip().split("\n")
-        hashes = [hash.strip('"') for hash in commit_hashes]
-        return [repo.commit(hash) for hash in hashes]
-    except GitCommandError as e:
-        if "no such path" in str(e).lower():
-            raise FileNotFoundError(f"The file '{file_path}' does not exist in the repository.")
-        raise OffalError(f"An error occurred while fetching commit history: {str(e)}")
+    # -s skips patch generation entirely; --no-renames avoids full-tree rename detection on each step.
+    # The range is its own argv element, so git takes it verbatim whatever characters the path contains
+    args = ["-L", f"{start_line},{end_line}:{file_path}", "-s", "--no-renames"]
+    args.extend(get_log_filter_args(author, before, after, limit, reverse, first_parent))
+    if rev_range:
+        args.append(rev_range)
+    return stream_log(repo, file_path, args)
 
 
-def get_file_revisions(repo: Repo, file_path: str) -> List[Commit]:
+def stream_log(repo: Repo, file_path: str, args: List[str]) -> Iterator[CommitDetails]:
+    """Run git log with LOG_FORMAT and parse the records as they arrive instead of buffering the whole output."""
     try:
-        return list(repo.iter_commits(paths=file_path))
+        proc = repo.git.log("-z", LOG_FORMAT, *args, as_process=True)
+        for record in iter_nul_records(proc):
+            if record:
+                yield parse_log_record(record.decode("utf-8", errors="replace"))
     except GitCommandError as e:
-        if "no such path" in str(e).lower():
+        message = str(e).lower()
+        # git log -L reports a missing file as "There is no path ... in the commit"
+        if "no such path" in message or "there is no path" in message:
             raise FileNotFoundError(f"The file '{file_path}' does not exist in the repository.")
         raise OffalError(f"An error occurred while fetching commit history: {str(e)}")
 
 
+def get_file_revisions(
+    repo: Repo,
+    file_path: str,
+    author: Optional[str] = None,
+    before: Optional[datetime] = None,
+    after: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    reverse: bool = False,
+    first_parent: bool = False,
+) -> Iterator[CommitDetails]:
+    filters = (author, before, after, limit, reverse, first_parent)
+    # With Bloom filters git log only opens the commits that may touch the path, which beats walking every
+    # commit in-process, so pygit2 is only used for repositories without them
+    use_pygit2 = pygit2 is not None and not has_commit_graph_filters(repo)
+    tree_path = get_tree_path(repo, file_path) if use_pygit2 else None
+    if tree_path is None:
+        return iter(GitLogCommitIterator(repo, file_path, *filters))
+    return iter(Pygit2CommitIterator(repo, tree_path, *filters))
+
+
+def get_tree_path(repo: Repo, file_path: str) -> Optional[str]:
+    """Return file_path relative to the top of the working tree, the way git log reads it, as a POSIX path.
+
+    git runs from the top of the working tree, so relative paths are taken from there. Pathspec globs and magic,
+    and paths outside the working tree, give None.
+    """
+    if not repo.working_tree_dir or file_path.startswith(":") or any(char in file_path for char in "*?["):
+        return None
+    root = repo.working_tree_dir
+    try:
+        relative = os.path.relpath(os.path.normpath(os.path.join(root, file_path)), root)
+    except ValueError:
+        # A path on another drive on Windows
+        return None
+    if relative == "." or relative == ".." or relative.startswith(".." + os.sep):
+        return None
+    return PurePath(relative).as_posix()
+
+
+class CommitIterator(ABC):
+    """Iterates, as CommitDetails, the commits that changed a file, with the history filters applied."""
+
+    def __init__(
+        self,
+        repo: Repo,
+        file_path: str,
+        author: Optional[str] = None,
+        before: Optional[datetime] = None,
+        after: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        reverse: bool = False,
+        first_parent: bool = False,
+    ):
+        self.repo = repo
+        self.file_path = file_path
+        self.author = author
+        self.before = before
+        self.after = after
+        self.limit = limit
+        self.reverse = reverse
+        self.first_parent = first_parent
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[CommitDetails]:
+        raise NotImplementedError
+
+
+class GitLogCommitIterator(CommitIterator):
+    """Runs one path-limited git log and lets git apply the filters and the limit."""
+
+    def __iter__(self) -> Iterator[CommitDetails]:
+        filter_args = get_log_filter_args(
+            self.author, self.before, self.after, self.limit, self.reverse, self.first_parent
+        )
+        return stream_log(self.repo, self.file_path, [*filter_args, "--", self.file_path])
+
+
+class Pygit2CommitIterator(CommitIterator):
+    """Walks history in-process with libgit2, filtering lazily and stopping once the limit is reached."""
+
+    def __iter__(self) -> Iterator[CommitDetails]:
+        return islice(filter_revisions(self.walk(), self.author, self.before, self.after), self.limit)
+
+    def walk(self) -> Iterator[CommitDetails]:
+        """Yield the commits that changed the file, simplifying history the way git log does by default."""
+        try:
+            repo = get_pygit2_repo(self.repo.git_dir)
+            commits = self.simplified_commits(repo)
+            if self.reverse:
+                # git log --reverse also walks everything first and then reverses the result
+                commits = reversed(list(commits))
+            for commit in commits:
+                message = commit.message
+                newline = message.find("\n")
+                summary = (message if newline == -1 else message[:newline]).strip()
+                tz = timezone(timedelta(minutes=commit.commit_time_offset))
+                yield CommitDetails(
+                    str(commit.id),
+                    summary,
+                    commit.author.name,
+                    commit.author.email,
+                    datetime.fromtimestamp(commit.commit_time, tz),
+                )
+        except pygit2.GitError as e:
+            raise OffalError(f"An error occurred while fetching commit history: {str(e)}")
+
+    def simplified_commits(self, repo) -> Iterator["pygit2.Commit"]:
+        """Walk from HEAD newest first by commit date, yielding the commits git log would list for the file.
+
+        A commit is TREESAME to a parent when the file's tree entry is the same in both, which needs no diff.
+        Such a commit is not listed, and a merge that is TREESAME to one of its parents is followed through
+        that parent alone, so whatever happened on the other side is never visited, just as in git log.
+        With first_parent only first parents are compared and followed, as with git log --first-parent.
+        """
+        file_path = self.file_path
+
+        def entry_id(commit):
+            try:
+                return commit.tree[file_path].id
+            except KeyError:
+                return None
+
+        head = repo[repo.head.target]
+        seen = {head.id}
+        # Ties on commit date are popped in the order they were queued, like git's own queue; len(seen) counts pushes
+        queue = [(-head.commit_time, len(seen), head, entry_id(head))]
+        while queue:
+            _, _, commit, file_id = heapq.heappop(queue)
+            parents = commit.parents[:1] if self.first_parent else commit.parents
+            parent_ids = [entry_id(parent) for parent in parents]
+            if file_id in parent_ids:
+                parent_index = parent_ids.index(file_id)
+                parents, parent_ids = [parents[parent_index]], [file_id]
+            elif parents or file_id is not None:
+                yield commit
+
+            for parent, parent_id in zip(parents, parent_ids):
+                if parent.id not in seen:
+                    seen.add(parent.id)
+                    heapq.heappush(queue, (-parent.commit_time, len(seen), parent, parent_id))
+
+
+def parse_log_record(record: str) -> CommitDetails:
+    hexsha, author_name, author_email, date, summary = record.split("\x1f")
+    return CommitDetails(hexsha, summary, author_name, author_email, datetime.fromisoformat(date))
+
+
 def filter_revisions(
-    revisions: List[Commit], author: Optional[str], before: Optional[datetime], after: Optional[datetime]
-) -> List[Commit]:
+    revisions: Iterable[CommitDetails], author: Optional[str], before: Optional[datetime], after: Optional[datetime]
+) -> Iterator[CommitDetails]:
+    # The filters are lazy so a limited walk can stop as soon as enough revisions have matched
     if author:
         revisions = filter_by_author(revisions, author)
     if before or after:
         revisions = filter_by_date(revisions, before, after)
-    return revisions
+    return iter(revisions)
 
 
-def get_blame_item(repo: Repo, file_path: str, line_number: int):
-    blame_result = repo.blame("HEAD", file_path, L=f"{line_number},{line_number}")
-    if not blame_result:
-        raise ValueError(f"No blame information found for line {line_number} in file {file_path}")
-    return next(iter(blame_result))
+def get_blame_item(repo: Repo, file_path: str, line_number: int) -> BlameEntry:
+    # Blame at HEAD is fixed by HEAD and the path, so the whole file is blamed once and cached by both.
+    # Resolving HEAD reads the ref files directly, so a hit runs no git process at all.
+    cache_key = hashlib.blake2b(f"{repo.head.commit.hexsha}\0{file_path}".encode(), digest_size=16).hexdigest()
+    line_commits = read_cache(repo, "blame", cache_key)
+    if line_commits is None:
+        line_commits = get_file_blame(repo, file_path)
+        write_cache(repo, "blame", cache_key, line_commits)
+        # Every new HEAD gets its own entries, so drop ones that have not been rewritten for a while
+        prune_cache(repo, "blame")
 
-
-def extract_commit_from_blame(blame_item) -> Commit:
-    if isinstance(blame_item, (tuple, list)) and len(blame_item) >= 1:
-        commit = blame_item[0]
-    else:
-        commit = getattr(blame_item, "commit", None)
+    if not 0 < line_number <= len(line_commits):
+        raise ValueError(f"No blame information found for line {line_number} in file {file_path}")
+    hexsha, orig_line = line_commits[line_number - 1]
+    return BlameEntry(
+        get_commit(repo, hexsha), range(line_number, line_number + 1), file_path, range(orig_line, orig_line + 1)
+    )
+
+
+def get_file_blame(repo: Repo, file_path: str) -> List[Tuple[str, int]]:
+    """Return the last-changing commit sha and its original line number for each line of the file at HEAD."""
+    output = repo.git.blame("--incremental", "HEAD", "--", file_path, stdout_as_string=False)
+    groups = {}
+    for line in output.split(b"\n"):
+        # Each group starts with "<sha> <orig line> <final line> <line count>"; groups arrive in no particular order
+        match = BLAME_HEADER_RE.match(line)
+        if match:
+            hexsha = match.group(1).decode("ascii")
+            orig_line, final_line, count = int(match.group(2)), int(match.group(3)), int(match.group(4))
+            for offset in range(count):
+                groups[final_line + offset] = (hexsha, orig_line + offset)
+    return [groups[line_number] for line_number in range(1, len(groups) + 1)]
+
+
+def extract_commit_from_blame(blame_item: BlameEntry) -> Commit:
+    commit = blame_item.commit
     if not isinstance(commit, Commit):
         raise TypeError(f"Expected Commit object, got {type(commit)}")
     return commit
 
 
-def trace_line_history(repo: Repo, file_path: str, line_number: int, initial_commit: Commit) -> List[Commit]:
-    revisions = []
-    current_commit = initial_commit
-    while True:
-        if not current_commit.parents:
-            revisions.append(current_commit)
-            break
-        parent_commit = current_commit.parents[0]
-        if line_modified(repo, file_path, line_number, current_commit, parent_commit):
-            revisions.append(current_commit)
-        current_commit = parent_commit
+def trace_line_history(repo: Repo, file_path: str, line_number: int, initial_commit: Commit) -> List[CommitDetails]:
+    cache_key = hashlib.blake2b(f"{file_path}#{line_number}".encode(), digest_size=16).hexdigest()
+    cached = read_cache(repo, "line-history", cache_key)
+    if cached and is_file_unchanged_since(repo, file_path, cached["commit"], initial_commit.hexsha):
+        return [
+            CommitDetails(hexsha, summary, author_name, author_email, datetime.fromisoformat(date))
+            for hexsha, summary, author_name, author_email, date in cached["revisions"]
+        ]
+
+    revisions = list(get_line_specific_revisions(repo, file_path, line_number, rev_range=initial_commit.hexsha))
+    write_cache(
+        repo,
+        "line-history",
+        cache_key,
+        {
+            "commit": initial_commit.hexsha,
+            "revisions": [
+                [commit.hexsha, commit.summary, commit.author_name, commit.author_email, commit.date.isoformat()]
+                for commit in revisions
+            ],
+        },
+    )
     return revisions
 
 
-def line_modified(repo: Repo, file_path: str, line_number: int, commit: Commit, parent_commit: Commit) -> bool:
-    diffs = commit.diff(parent_commit, paths=file_path, create_patch=True)
-    for diff in diffs:
-        if diff.a_path == file_path:
-            return check_line_in_diff(diff, line_number)
-    return False
-
-
-def check_line_in_diff(diff, line_number: int) -> bool:
-    diff_lines = diff.diff.decode("utf-8").splitlines()
-    line_offset = 0
-    for line in diff_lines:
-        if line.startswith("+"):
-            line_offset += 1
-        elif line.startswith("-"):
-            line_offset -= 1
-            if line_offset + line_number == 0:
-                return True
-        elif not line.startswith("@"):
-            if line_offset < 0:
-                line_number += 1
-            elif line_offset > 0:
-                line_number -= 1
-    return False
-
-
-def filter_by_author(revisions: List[Commit], author: str) -> List[Commit]:
-    return [
+def is_file_unchanged_since(repo: Repo, file_path: str, checkpoint: str, commit: str) -> bool:
+    """Check that checkpoint is an ancestor of commit and no commit in between touched file_path.
+
+    When that holds, any line of the file has the same history at both commits.
+    """
+    if checkpoint == commit:
+        return True
+    try:
+        if not repo.is_ancestor(checkpoint, commit):
+            return False
+        return not repo.git.rev_list("-n1", f"{checkpoint}..{commit}", "--", file_path)
+    except (GitCommandError, ValueError):
+        # The checkpoint may no longer exist, e.g. after a rebase and gc
+        return False
+
+
+def filter_by_author(revisions: Iterable[CommitDetails], author: str) -> Iterator[CommitDetails]:
+    # Only used by the pygit2 walk; git log applies --author itself
+    author = author.casefold()
+    return (
         commit
         for commit in revisions
-        if author.lower() in (commit.author.name.lower() if commit.author.name else "")
-        or author.lower() in (commit.author.email.lower() if commit.author.email else "")
-    ]
+        if author in commit.author_name.casefold() or author in commit.author_email.casefold()
+    )
 
 
-def filter_by_date(revisions: List[Commit], before: Optional[datetime], after: Optional[datetime]) -> List[Commit]:
-    return [
+def filter_by_date(
+    revisions: Iterable[CommitDetails], before: Optional[datetime], after: Optional[datetime]
+) -> Iterator[CommitDetails]:
+    return (
         commit
         for commit in revisions
-        if (not before or commit.committed_datetime <= before) and (not after or commit.committed_datetime >= after)
-    ]
+        if (not before or commit.date <= before) and (not after or commit.date >= after)
+    )
 
 
-def print_commits(commits: List[Commit], file_path: str, line_number: Optional[int] = None, reverse: bool = False):
+def print_commits(
+    commits: List[CommitDetails], file_path: str, line_number: Optional[int] = None, reverse: bool = False
+):
     console.print(f"[bold]Commit History for {file_path}{f' (line {line_number})' if line_number else ''}:[/bold]\n")
-    for commit in commits:
-        # Get only the first line of the commit message
-        first_line = commit.message.strip().splitlines()[0]
-
-        console.print(
-            f"[yellow]{commit.hexsha[:7]}[/yellow] {commit.committed_datetime.strftime('%Y-%m-%d')} [green]{commit.author.name}[/green] {first_line}"
+    # Built as Text so commit subjects are never parsed as markup
+    rows = [
+        Text.assemble(
+            (commit.short_sha, "yellow"), f" {commit.short_date} ", (commit.author_name, "green"), f" {commit.summary}"
         )
+        for commit in commits
+    ]
+    if rows:
+        console.print(Text("\n").join(rows), highlight=False)
 
     if line_number and commits:
         if reverse:
-            console.print(f"\nLine {line_number} was first introduced in commit {commits[-1].hexsha[:7]}")
+            console.print(f"\nLine {line_number} was first introduced in commit {commits[-1].short_sha}")
         else:
-            console.print(f"\nLine {line_number} was last modified in commit {commits[0].hexsha[:7]}")
+            console.print(f"\nLine {line_number} was last modified in commit {commits[0].short_sha}")
 
 
+@lru_cache(maxsize=None)
 def parse_date(date_str: str) -> datetime:
+    match = DATE_RE.fullmatch(date_str)
     try:
-        return datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        if not match:
+            raise ValueError(date_str)
+        return datetime(*map(int, match.groups()), tzinfo=timezone.utc)
     except ValueError:
         raise typer.BadParameter("Date must be in the format YYYY-MM-DD")
 
@@ -220,21 +470,39 @@ def history(
     before: Optional[str] = typer.Option(None, "--before", help="Show revisions before a given date (YYYY-MM-DD)"),
     after: Optional[str] = typer.Option(None, "--after", help="Show revisions after a given date (YYYY-MM-DD)"),
     traverse: bool = typer.Option(False, "--traverse", "-t", help="Traverse each revision in detail"),
+    first_parent: bool = typer.Option(
+        False, "--first-parent", help="Follow only the first parent of merge commits, skipping merged-in branches"
+    ),
 ):
     """Show commit history for the pinned file or a specified file."""
     try:
-        file_path, pinned_line = get_file_info(file_path)
-        use_line_number = line_number or (None if ignore_line_number else pinned_line)
-
         try:
-            before_date = datetime.strptime(before, "%Y-%m-%d").replace(tzinfo=timezone.utc) if before else None
-            after_date = datetime.strptime(after, "%Y-%m-%d").replace(tzinfo=timezone.utc) if after else None
-        except ValueError:
+            file_path, pinned_line, before_date, after_date = parse_history_args(file_path, before, after)
+        except typer.BadParameter:
             console.print("Error: Date must be in the format YYYY-MM-DD")
             return
+        use_line_number = line_number or (None if ignore_line_number else pinned_line)
 
         repo = get_repo()
-        commits = get_revisions(repo, file_path, use_line_number, reverse, author, before_date, after_date)
+        # Traversal steps through every revision; otherwise one extra is fetched to tell whether there are more
+        fetch_limit = None if traverse else limit + 1
+        revisions = get_revisions(
+            repo,
+            file_path,
+            use_line_number,
+            reverse,
+            author,
+            before_date,
+            after_date,
+            limit=fetch_limit,
+            first_parent=first_parent,
+        )
+        if traverse:
+            commits = list(revisions)
+        else:
+            commits = list(islice(revisions, limit))
+            # Peek one past the limit to tell whether there are more, without counting the rest
+            has_more = next(revisions, None) is not None
 
         if author and not commits:
             console.print(f"No commits found for author: {author}")
@@ -253,13 +521,13 @@ def history(
             return
 
         if traverse:
-            traverse_commits(commits, file_path, use_line_number)
+            traverse_commits(repo, commits, file_path, use_line_number)
             return
 
-        print_commits(commits[:limit], file_path, use_line_number, reverse)
+        print_commits(commits, file_path, use_line_number, reverse)
 
-        if len(commits) > limit:
-            console.print(f"\nShowing {limit} of {len(commits)} commits. Use --limit option to see more.")
+        if has_more:
+            console.print(f"\nShowing the first {limit} commits. Use --limit option to see more.")
 
         if pinned_line and not use_line_number and not ignore_line_number:
             console.print(
@@ -274,28 +542,42 @@ def history(
             console.print(f"Error details: {type(e).__name__} at line {e.__traceback__.tb_lineno}")
 
 
-def get_file_info(file_path: Optional[str]) -> tuple[str, Optional[int]]:
-    if not file_path:
-        pinned_item = get_pinned_item("file")
-        if not pinned_item:
-            raise OffalError(
-                "No file is currently pinned. Use 'offal pin file' to pin a file or provide a file path with --file option."
-            )
-        if isinstance(pinned_item, str) and "#" in pinned_item:
-            file_path, pinned_line = pinned_item.split("#")
-            return file_path, int(pinned_line)
-        if isinstance(pinned_item, str):
-            return pinned_item, None
-        raise OffalError("Invalid pinned item type")
-    return file_path, None
+def parse_history_args(
+    file_path: Optional[str], before: Optional[str], after: Optional[str]
+) -> Tuple[str, Optional[int], Optional[datetime], Optional[datetime]]:
+    """Resolve the target file, its pinned line and the date bounds for a history invocation."""
+    file_path, pinned_line = get_file_info(file_path)
+    before_date = parse_date(before) if before else None
+    after_date = parse_date(after) if after else None
+    return file_path, pinned_line, before_date, after_date
+
+
+class CommitView:
+    """A commit being browsed, computing its file list and diff on first use and reusing them afterwards."""
+
+    def __init__(self, commit: Commit, file_path: str):
+        self.commit = commit
+        self.file_path = file_path
 
+    @cached_property
+    def files_changed(self) -> str:
+        return get_files_changed(self.commit)
 
-def traverse_commits(commits: List[Commit], file_path: str, line_number: Optional[int] = None):
+    @cached_property
+    def diff_text(self) -> str:
+        return get_commit_diff(self.commit, self.file_path)
+
+
+def traverse_commits(repo: Repo, commits: List[CommitDetails], file_path: str, line_number: Optional[int] = None):
     index = 0
+    # Views are kept per position so going back and forth does not ask git for the same data twice
+    views = {}
     while index < len(commits):
         console.clear()
-        commit = commits[index]
-        display_commit_details(commit, file_path, line_number, index, len(commits))
+        view = views.get(index)
+        if view is None:
+            view = views[index] = CommitView(get_commit(repo, commits[index].hexsha), file_path)
+        display_commit_details(view, line_number, index, len(commits))
 
         user_input = Prompt.ask("Press 'c' to continue, 'b' to go back, 'd' to show diff, 'q' to quit", default="c", show_default=True)
 
@@ -306,19 +588,20 @@ def traverse_commits(commits: List[Commit], file_path: str, line_number: Optiona
         elif user_input == "b" and index > 0:
             index -= 1
         elif user_input == "d":
-            show_diff_in_pager(commit, file_path, line_number)
+            show_diff_in_pager(view, line_number)
 
 
-def show_diff_in_pager(commit: Commit, file_path: str, line_number: Optional[int] = None):
+def show_diff_in_pager(view: CommitView, line_number: Optional[int] = None):
     with console.pager():
-        diff = get_commit_diff(commit, file_path)
+        diff = view.diff_text
         if diff:
             syntax = Syntax(diff, "diff", theme="material", background_color="default")
             # diff_panel = Panel(syntax, title="Diff", border_style="white", expand=True)
             console.print(syntax)
 
 
-def display_commit_details(commit: Commit, file_path: str, line_number: Optional[int] = None, index: int = 0, total_commits: int = 0):
+def display_commit_details(view: CommitView, line_number: Optional[int] = None, index: int = 0, total_commits: int = 0):
+    commit = view.commit
     commit_details = Text()
     commit_details.append(f"Commit: {commit.hexsha}\n", style="bold blue")
 
@@ -337,13 +620,13 @@ def display_commit_details(commit: Commit, file_path: str, line_number: Optional
     panel_title = f"Commit Details ({index + 1}/{total_commits})"
     console.print(Panel(commit_details, title=panel_title))
 
-    # diff = get_commit_diff(commit, file_path)
+    # diff = view.diff_text
     # if diff:
     #     syntax = Syntax(diff, "diff", theme="material", background_color="default")
     #     diff_panel = Panel(syntax, title="Diff", border_style="white", expand=True)
     #     console.print(diff_panel)
 
-    files_changed = get_files_changed(commit)
+    files_changed = view.files_changed
     if files_changed:
         files_panel = Panel(Text(files_changed), title="Files Changed")
         console.print(files_panel)
@@ -353,17 +636,15 @@ def display_commit_details(commit: Commit, file_path: str, line_number: Optional
 
 def get_commit_diff(commit: Commit, file_path: str) -> str:
     try:
-        if not commit.parents:
-            # Handle initial commit uniquely
-            file_content = commit.repo.git.show(f"{commit.hexsha}:{file_path}")
-            diff_output = format_initial_commit_diff(file_content, file_path)
-        else:
-            # Generate the diff for subsequent commits
-            diff_output = commit.repo.git.diff("--unified=0", '--color=always', f"{commit.hexsha}^!", file_path)
+        revs = [commit.parents[0].hexsha, commit.hexsha] if commit.parents else ["--root", commit.hexsha]
+        args = ["-p", "--no-commit-id", "--unified=0", "--no-color", "--no-ext-diff", *revs, "--", file_path]
+        proc = commit.repo.git.diff_tree(*args, as_process=True)
+        lines = (line.decode("utf-8", errors="replace").rstrip("\n") for line in proc.stdout)
+        diff_output = "\n".join(iter_numbered_diff_lines(lines))
+        proc.wait()
 
         if not diff_output:
             return "No diff available"
-        # return add_line_numbers_to_diff(diff_output)
         return diff_output
     except GitCommandError as e:
         return f"Error obtaining diff: {str(e)}"
@@ -371,67 +652,46 @@ def get_commit_diff(commit: Commit, file_path: str) -> str:
         return f"Error processing diff: {str(e)}"
 
 
-def format_initial_commit_diff(file_content: str, file_path: str) -> str:
-    lines = file_content.split("\n")
-    formatted_lines = []
-
-    # Add the diff header for a new file
-    formatted_lines.append(f"diff --git a/{file_path} b/{file_path}")
-    formatted_lines.append("new file mode 100644")
-    formatted_lines.append("index 0000000..c65711b")  # Placeholder index, consider obtaining it dynamically if needed
-    formatted_lines.append("--- /dev/null")
-    formatted_lines.append(f"+++ b/{file_path}")
-
-    line_number = 0  # Start numbering from 0 for the new file context
-    for line in lines:
-        line_prefix = f"{line_number + 1:5}:"
-        formatted_lines.append(f"{line_prefix} +{line}")
-        line_number += 1
-
-    # Optional: Handle the "\ No newline at end of file" explicitly
-    formatted_lines.append(f"{line_number + 1:5}: \\ No newline at end of file")
-
-    return "\n".join(formatted_lines)
+def add_line_numbers_to_diff(diff_output: str) -> str:
+    return "\n".join(iter_numbered_diff_lines(diff_output.split("\n")))
 
 
-def add_line_numbers_to_diff(diff_output: str) -> str:
-    lines = diff_output.split("\n")
-    new_lines = []
+def iter_numbered_diff_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Prefix each added or removed line with its line number in the new or old file respectively."""
+    in_hunk = False
     old_line_number = 0
     new_line_number = 0
 
     for line in lines:
-        if line.startswith("@@"):
-            parts = line.split()
-            if len(parts) > 2:
-                old_line_info = parts[1]
-                new_line_info = parts[2]
-                try:
-                    old_line_number = abs(int(old_line_info.split(",")[0].lstrip("-")))
-                    new_line_number = abs(int(new_line_info.split(",")[0].lstrip("+")))
-                except ValueError:
-                    pass
-            new_lines.append(line)
-        elif line.startswith("+") and "\\ No newline at end of file" not in line:
-            new_lines.append(f"{new_line_number:5}: {line}")
+        prefix = line[:1]
+        if prefix == "@" and line.startswith("@@"):
+            match = HUNK_HEADER_RE.match(line)
+            if match:
+                in_hunk = True
+                old_line_number, new_line_number = int(match.group(1)), int(match.group(2))
+        elif prefix == "d" and line.startswith("diff "):
+            # File headers (---/+++) follow until the next hunk starts
+            in_hunk = False
+        elif not in_hunk:
+            pass
+        elif prefix == "+" and NO_NEWLINE_MARKER not in line:
+            line = f"{new_line_number:5}: {line}"
             new_line_number += 1
-        elif line.startswith("-") and "\\ No newline at end of file" not in line:
-            new_lines.append(f"{old_line_number:5}: {line}")
+        elif prefix == "-" and NO_NEWLINE_MARKER not in line:
+            line = f"{old_line_number:5}: {line}"
             old_line_number += 1
-        else:
-            new_lines.append(line)
-            if line != "\\ No newline at end of file":
-                old_line_number += 1
-                new_line_number += 1
-
-    return "\n".join(new_lines)
+        elif line != NO_NEWLINE_MARKER:
+            old_line_number += 1
+            new_line_number += 1
+        yield line
 
 
 def get_files_changed(commit: Commit) -> str:
     try:
-        # Convert each key to a string
-        file_paths = [str(path) for path in commit.stats.files.keys()]
-        return "\n".join(file_paths)
+        # Merges list the files changed against their first parent
+        revs = [commit.parents[0].hexsha, commit.hexsha] if commit.parents else ["--root", commit.hexsha]
+        output = commit.repo.git.diff_tree("--no-commit-id", "--name-only", "--no-renames", "-r", "-z", *revs)
+        return "\n".join(path for path in output.split("\x00") if path)
     except Exception as e:
         return f"Error obtaining file list: {str(e)}"
 
@@ -1,7 +1,7 @@
 import typer
 from typing_extensions import Annotated, Optional
 
-from offal.pinned import remove_pinned_item, set_pinned_item
+from offal.pinned import remove_pinned_item, set_pinned_item, split_pin
 
 app = typer.Typer()
 
@@ -14,18 +14,13 @@ def pin(
         remove_pinned_item("file")
         typer.echo("File pin cleared")
     elif file_path:
-        if '#' in file_path:
-            file_part, line_part = file_path.split('#')
-            try:
-                line_number = int(line_part)
-                pin_value = f"{file_part}#{line_number}"
-                set_pinned_item("file", pin_value)
-                typer.echo(f"Pinned to file {file_part} at line {line_number}")
-            except ValueError:
-                typer.echo("Invalid line number. Using the entire path as is.")
-                set_pinned_item("file", file_path)
-                typer.echo(f"Pinned to file {file_path}")
+        file_part, line_number = split_pin(file_path)
+        if line_number is not None:
+            set_pinned_item("file", f"{file_part}#{line_number}")
+            typer.echo(f"Pinned to file {file_part} at line {line_number}")
         else:
+            if '#' in file_path:
+                typer.echo("Invalid line number. Using the entire path as is.")
             set_pinned_item("file", file_path)
             typer.echo(f"Pinned to file {file_path}")
     else:
@@ -1,14 +1,25 @@
+import hashlib
+import re
 import typer
 from rich.console import Console
+from rich.style import Style
 from rich.table import Table
 from rich.syntax import Syntax
-from git import Repo
 from collections import Counter
-from offal.pinned import get_pinned_item
+from offal.cache import prune_cache, read_cache, write_cache
+from offal.commands._common import OffalError, get_repo, iter_nul_records, read_blob
+from offal.pinned import get_pinned_item, split_pin
 
 app = typer.Typer()
 console = Console()
 
+# New-side start and optional line count of a unified diff hunk header, found anywhere in a patch
+HUNK_RE = re.compile(rb"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@", re.MULTILINE)
+
+# Column styles for the summary table, parsed once rather than on every render
+FILE_STYLE = Style.parse("cyan")
+COUNT_STYLE = Style.parse("magenta")
+
 @app.callback(invoke_without_command=True)
 def related(
     limit: int = typer.Option(None, "--limit", "-l", help="Limit the number of related files shown")
@@ -19,41 +30,29 @@ def related(
         console.print("No file is currently pinned. Use 'offal pin file' to pin a file first.")
         return
 
-    repo = Repo(search_parent_directories=True)
+    try:
+        repo = get_repo()
+    except OffalError as e:
+        console.print(f"Error: {str(e)}")
+        return
 
-    if "#" in pinned_file:
-        file_path, line_number = pinned_file.split("#")
-        line_number = int(line_number)
-    else:
-        file_path = pinned_file
+    file_path, line_number = split_pin(pinned_file)
 
     show_related_files(repo, file_path, limit)
 
 def show_related_files(repo, file_path, limit=None):
     try:
-        commits = list(repo.iter_commits(paths=file_path))
+        file_changes = get_related_files(repo, file_path)
 
-        if not commits:
+        if file_changes is None:
             console.print(f"No commit history found for {file_path}")
             return
 
-        file_changes = Counter()
-
-        for commit in commits:
-            changed_files = get_changed_files(commit)
-            file_changes.update(changed_files)
-
-        # Remove the pinned file from the counter
-        if file_path in file_changes:
-            del file_changes[file_path]
-
         # Get the most common files, limited if specified
         most_common = file_changes.most_common(limit)
 
         # Display summary table
-        summary_table = Table(title=f"Files Modified Together with {file_path}")
-        summary_table.add_column("File", style="cyan")
-        summary_table.add_column("Times Modified Together", justify="right", style="magenta")
+        summary_table = _make_summary_table(file_path)
 
         for file, count in most_common:
             summary_table.add_row(file, str(count))
@@ -68,53 +67,78 @@ def show_related_files(repo, file_path, limit=None):
         if e.__traceback__:
             console.print(f"Error details: {type(e).__name__} at line {e.__traceback__.tb_lineno}")
 
+def _make_summary_table(file_path):
+    summary_table = Table(title=f"Files Modified Together with {file_path}")
+    summary_table.add_column("File", style=FILE_STYLE)
+    summary_table.add_column("Times Modified Together", justify="right", style=COUNT_STYLE)
+    return summary_table
+
 def is_line_modified(commit, file_path, target_line_number):
     if not commit.parents:
         return True  # Initial commit, consider it as modifying all lines
 
-    diffs = commit.parents[0].diff(commit, paths=file_path, create_patch=True)
-    if not diffs:
+    # With no context lines a hunk's new-side range is exactly the lines it added, so only the headers matter
+    patch = commit.repo.git.diff_tree(
+        '-p', '--unified=0', '--no-color', '--no-ext-diff', commit.parents[0].hexsha, commit.hexsha, '--', file_path,
+        stdout_as_string=False,
+    )
+    if not patch:
         return False
 
-    diff = diffs[0]
-    patch = diff.diff.decode('utf-8')
-
-    current_line = 1
-    for line in patch.split('\n'):
-        if line.startswith('@@'):
-            # Parse the hunk header
-            hunk_info = line.split('@@')[1].strip()
-            try:
-                new_start = int(hunk_info.split('+')[1].split(',')[0])
-                current_line = new_start
-            except IndexError:
-                continue
-        elif not line.startswith('-'):
-            if current_line == target_line_number:
-                return not line.startswith(' ')  # Modified if it's a '+' line
-            current_line += 1
+    for match in HUNK_RE.finditer(patch):
+        new_start = int(match.group(1))
+        new_count = int(match.group(2)) if match.group(2) is not None else 1
+        if new_start > target_line_number:
+            return False
+        if target_line_number < new_start + new_count:
+            return True
 
     return False
 
-def get_changed_files(commit):
-    if not commit.parents:
-        return [item.path for item in commit.tree.traverse() if item.type == 'blob']
-    else:
-        return list(commit.stats.files.keys())
+def get_related_files(repo, file_path):
+    # History reachable from a given HEAD never changes, so the counts are cached on disk by HEAD and file
+    cache_key = hashlib.blake2b(f"{repo.head.commit.hexsha}\0{file_path}".encode(), digest_size=16).hexdigest()
+    cached = read_cache(repo, "related", cache_key)
+    if cached is not None:
+        return None if cached["files"] is None else Counter(cached["files"])
+
+    file_changes = count_co_changed_files(repo, file_path)
+    write_cache(repo, "related", cache_key, {"files": file_changes})
+    # Every new HEAD gets its own entries, so drop ones that have not been rewritten for a while
+    prune_cache(repo, "related")
+    return file_changes
+
+def count_co_changed_files(repo, file_path):
+    """Count how often each other file changed in the commits that touched file_path, or None if there are none.
+
+    One git log lists the files of every such commit; --full-diff names all of a commit's files rather
+    than only the pathspec.
+    """
+    proc = repo.git.log(
+        '--name-only', '--full-diff', '--no-renames', '-z', '--format=%x00', '--', file_path, as_process=True
+    )
+    file_changes = Counter()
+    found = False
+    for record in iter_nul_records(proc):
+        # Empty records delimit commits; the first name of each commit follows the header's newline
+        name = record.lstrip(b'\n')
+        if name:
+            found = True
+            name = name.decode('utf-8', errors='replace')
+            if name != file_path:
+                file_changes[name] += 1
+    return file_changes if found else None
 
 def show_related_lines(repo, file_path, line_number, context=5):
     try:
         commit = next(repo.iter_commits(paths=file_path, max_count=1))
         console.print(f"Last commit for {file_path}: {commit.hexsha}")
 
-        file_content = commit.tree[file_path].data_stream.read().decode('utf-8')
-        lines = file_content.splitlines()
+        data = read_blob(repo, commit.hexsha, file_path)
 
         start_line = max(1, line_number - context)
-        end_line = min(len(lines), line_number + context)
-
-        display_lines = lines[start_line-1:end_line]
-        line_numbers = range(start_line, end_line + 1)
+        display_lines = read_line_window(data, start_line, line_number + context)
+        line_numbers = range(start_line, start_line + len(display_lines))
 
         numbered_lines = [f"{num}: {line}" for num, line in zip(line_numbers, display_lines)]
 
@@ -131,3 +155,18 @@ def show_related_lines(repo, file_path, line_number, context=5):
         console.print(f"No commit history found for {file_path}")
     except KeyError:
         console.print(f"File {file_path} not found in the last commit")
+
+def read_line_window(data, start_line, end_line):
+    """Decode only lines start_line to end_line (1-based, inclusive) of a blob, locating them by byte offset."""
+    start = 0
+    for _ in range(start_line - 1):
+        start = data.find(b'\n', start) + 1
+        if not start:
+            return []
+    end = start
+    for _ in range(end_line - start_line + 1):
+        end = data.find(b'\n', end) + 1
+        if not end:
+            end = len(data)
+            break
+    return data[start:end].decode('utf-8', errors='replace').splitlines()
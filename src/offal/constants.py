@@ -1,2 +1,5 @@
 APP_NAME = "offal"
 PINNED_FILENAME = ".pinned"
+CACHE_DIRNAME = "cache"
+# Seconds a cache entry is kept after it was written
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
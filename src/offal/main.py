@@ -12,7 +12,7 @@ from typing_extensions import Annotated
 import offal.commands.history
 import offal.commands.pin
 import offal.commands.related
-from offal.pinned import get_pinned_item
+from offal.pinned import get_pinned_item, split_pin
 
 app = typer.Typer()
 console = Console()
@@ -30,8 +30,8 @@ def status():
 
     if pinned_file:
         console.print("Pinned file:")
-        if "#" in pinned_file:
-            file_path, line_number = pinned_file.split("#")
+        file_path, line_number = split_pin(pinned_file)
+        if line_number is not None:
             console.print(f"- {file_path} (line {line_number})")
         else:
             console.print(f"- {pinned_file}")
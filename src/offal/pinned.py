@@ -1,11 +1,15 @@
+import os
 from functools import lru_cache
 from pathlib import Path
+from typing import Optional, Tuple
 
 import git
 
 from offal.constants import PINNED_FILENAME
 
 
+# The repository and its pin file do not move during a run
+@lru_cache(maxsize=None)
 def get_pinned_path():
     repo = git.Repo(search_parent_directories=True)
 
@@ -21,51 +25,75 @@ def get_pinned_path():
     return pinned_file
 
 
-@lru_cache(maxsize=1)
 def parse_pinned_file(file: Path):
     pinned_items = {}
 
     if file.is_file():
-        with file.open("r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                key, value = line.split("=", 1)
+        for line in file.read_text().splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            key, sep, value = line.partition("=")
+            if sep:
                 pinned_items[key.strip()] = value.strip()
     return pinned_items
 
 
+def split_pin(pin: str) -> Tuple[str, Optional[int]]:
+    """Split a "path#line" pin into the path and line number; a pin without a line number gives None."""
+    file_path, sep, line = pin.rpartition("#")
+    if sep and line.isdecimal():
+        return file_path, int(line)
+    return pin, None
+
+
+# Cleared by the setters below whenever they rewrite the file
+@lru_cache(maxsize=None)
+def _load_pins():
+    return parse_pinned_file(get_pinned_path())
+
+
 def get_pinned_item(key):
-    pinned_items = parse_pinned_file(get_pinned_path())
-    return pinned_items.get(key)
+    return _load_pins().get(key)
 
 
 def set_pinned_item(key, value):
     file = get_pinned_path()
-    pinned_items = parse_pinned_file(file)
+    pinned_items = _load_pins()
+
+    if key not in pinned_items:
+        # A new key only needs one line added at the end, and the cached pins then match the file again
+        line = f"{key}={value}\n".encode()
+        with file.open("a+b") as f:
+            # A hand-edited file may not end with a newline
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line
+            f.write(line)
+        pinned_items[key] = value
+        return
+
+    # Copied so the cached pins are not changed before the file is written
+    pinned_items = dict(pinned_items)
     pinned_items[key] = value
-
-    with file.open("w") as f:
-        for key, value in pinned_items.items():
-            f.write(f"{key}={value}\n")
-
-    parse_pinned_file.cache_clear()
+    write_pinned_file(file, pinned_items)
+    _load_pins.cache_clear()
 
 
 def remove_pinned_item(key):
     file = get_pinned_path()
-    pinned_items = parse_pinned_file(file)
+    pinned_items = dict(_load_pins())
     pinned_items.pop(key, None)
+    write_pinned_file(file, pinned_items)
+    _load_pins.cache_clear()
 
-    with file.open("w") as f:
-        for key, value in pinned_items.items():
-            f.write(f"{key}={value}\n")
 
-    parse_pinned_file.cache_clear()
+def write_pinned_file(file: Path, pinned_items):
+    file.write_text("".join(f"{key}={value}\n" for key, value in pinned_items.items()))
 
 
 def clear_pinned_items():
     file = get_pinned_path()
     file.write_text("")
-    parse_pinned_file.cache_clear()
+    _load_pins.cache_clear()
@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import pytest
+from git import Repo
+
+
+class ScratchRepo:
+    """A throwaway repository whose commits get increasing dates, one day apart."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.repo = Repo.init(path)
+        with self.repo.config_writer() as config:
+            config.set_value("user", "name", "Test User")
+            config.set_value("user", "email", "test@example.com")
+            config.set_value("commit", "gpgsign", "false")
+        self.day = 0
+
+    def next_date(self) -> str:
+        self.day += 1
+        return f"2024-01-{self.day:02d}T12:00:00+00:00"
+
+    def commit(self, message: str, files=None, author: str = "Test User <test@example.com>") -> str:
+        for name, content in (files or {}).items():
+            file = self.path / name
+            file.parent.mkdir(parents=True, exist_ok=True)
+            file.write_text(content)
+            self.repo.git.add("--", name)
+        date = self.next_date()
+        self.repo.git.commit(
+            "-q", "--allow-empty", "-m", message, f"--author={author}",
+            env={"GIT_AUTHOR_DATE": date, "GIT_COMMITTER_DATE": date},
+        )
+        return self.repo.head.commit.hexsha
+
+    def merge(self, branch: str, message: str) -> str:
+        date = self.next_date()
+        self.repo.git.merge(
+            "-q", "--no-ff", "-m", message, branch, env={"GIT_AUTHOR_DATE": date, "GIT_COMMITTER_DATE": date}
+        )
+        return self.repo.head.commit.hexsha
+
+
+@pytest.fixture
+def scratch_repo(tmp_path):
+    return ScratchRepo(tmp_path / "repo")
@@ -0,0 +1,30 @@
+import os
+from types import SimpleNamespace
+
+from offal.cache import prune_cache, read_cache, write_cache
+
+
+def test_cache_round_trip(tmp_path):
+    repo = SimpleNamespace(working_tree_dir=str(tmp_path), git_dir=str(tmp_path / ".git"))
+
+    assert read_cache(repo, "blame", "abc") is None
+
+    write_cache(repo, "blame", "abc", [["a" * 40, 1]])
+
+    assert read_cache(repo, "blame", "abc") == [["a" * 40, 1]]
+    assert (tmp_path / ".offal" / "cache" / "blame" / "abc.json").is_file()
+    assert (tmp_path / ".offal" / "cache" / ".gitignore").read_text() == "*\n"
+    assert not (tmp_path / ".offal" / ".gitignore").exists()
+
+
+def test_prune_cache(tmp_path):
+    repo = SimpleNamespace(working_tree_dir=str(tmp_path), git_dir=str(tmp_path / ".git"))
+    write_cache(repo, "blame", "old", [])
+    write_cache(repo, "blame", "new", [])
+    old_path = tmp_path / ".offal" / "cache" / "blame" / "old.json"
+    os.utime(old_path, (0, 0))
+
+    prune_cache(repo, "blame")
+
+    assert not old_path.exists()
+    assert read_cache(repo, "blame", "new") == []
@@ -0,0 +1,71 @@
+import io
+
+import pytest
+from git import Repo
+
+from offal.commands._common import (
+    ensure_commit_graph,
+    get_commit_graph_files,
+    has_changed_path_filters,
+    iter_nul_records,
+    read_blob,
+)
+
+
+def test_ensure_commit_graph_adds_changed_path_filters(scratch_repo):
+    scratch_repo.commit("one", {"f": "1\n"})
+    repo = scratch_repo.repo
+    info_dir = scratch_repo.path / ".git" / "objects" / "info"
+    # What gc and fetch.writeCommitGraph write: a graph without Bloom filters
+    repo.git.commit_graph("write", "--reachable", "--split")
+    assert not has_changed_path_filters(get_commit_graph_files(info_dir)[0])
+
+    ensure_commit_graph(repo)
+
+    graph_files = get_commit_graph_files(info_dir)
+    assert graph_files and all(has_changed_path_filters(graph_file) for graph_file in graph_files)
+
+
+def test_ensure_commit_graph_uses_common_dir_in_worktree(scratch_repo, tmp_path):
+    scratch_repo.commit("one", {"f": "1\n"})
+    scratch_repo.repo.git.worktree("add", "-q", str(tmp_path / "linked"))
+
+    ensure_commit_graph(Repo(tmp_path / "linked"))
+
+    assert has_changed_path_filters(scratch_repo.path / ".git" / "objects" / "info" / "commit-graph")
+
+
+class FakeProcess:
+    def __init__(self, output: bytes):
+        self.stdout = io.BytesIO(output)
+        self.waited = False
+
+    def wait(self):
+        self.waited = True
+
+
+def test_iter_nul_records_across_read_boundary():
+    # The second record starts just before the 64 KiB read boundary and ends after it
+    first, second = b"a" * (64 * 1024 - 6), b"b" * 20
+    proc = FakeProcess(first + b"\x00" + second + b"\x00\x00last")
+
+    assert list(iter_nul_records(proc)) == [first, second, b"", b"last"]
+    assert proc.waited
+
+
+def test_iter_nul_records_small_reads():
+    proc = FakeProcess(b"one\x00\x00two\x00")
+
+    assert list(iter_nul_records(proc, read_size=2)) == [b"one", b"", b"two"]
+
+
+def test_read_blob(scratch_repo):
+    commit = scratch_repo.commit("one", {"dir/f": "1\n"})
+    scratch_repo.commit("two", {"dir/f": "2\n"})
+    repo = scratch_repo.repo
+
+    assert read_blob(repo, commit, "dir/f") == b"1\n"
+    assert read_blob(repo, "HEAD", "dir/f") == b"2\n"
+    for path in ("dir", "missing"):
+        with pytest.raises(KeyError):
+            read_blob(repo, "HEAD", path)
@@ -0,0 +1,265 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import typer
+from git.cmd import Git
+from typer.testing import CliRunner
+
+from offal.commands import history
+from offal.commands._common import FileNotFoundError
+from offal.commands.history import (
+    add_line_numbers_to_diff,
+    get_blame_item,
+    get_file_blame,
+    get_file_revisions,
+    get_log_filter_args,
+    get_revisions,
+    get_tree_path,
+    is_file_unchanged_since,
+    parse_date,
+    parse_log_record,
+    stream_log,
+)
+
+
+def test_parse_log_record():
+    record = "a" * 40 + "\x1fJane Doe\x1fjane@example.com\x1f2024-03-01T10:00:00+01:00\x1fFix bug"
+
+    commit = parse_log_record(record)
+
+    assert commit.hexsha == "a" * 40
+    assert commit.summary == "Fix bug"
+    assert commit.author_name == "Jane Doe"
+    assert commit.author_email == "jane@example.com"
+    assert commit.date == datetime(2024, 3, 1, 10, tzinfo=timezone(timedelta(hours=1)))
+    assert commit.short_sha == "a" * 7
+    assert commit.short_date == "2024-03-01"
+
+
+def test_stream_log(scratch_repo):
+    first = scratch_repo.commit("Initial commit", {"f": "1\n"})
+    scratch_repo.commit("Unrelated", {"g": "1\n"})
+    second = scratch_repo.commit("Fix bug", {"f": "2\n"}, author="Jane Doe <jane@example.com>")
+
+    revisions = list(stream_log(scratch_repo.repo, "f", ["--", "f"]))
+
+    assert [commit.hexsha for commit in revisions] == [second, first]
+    assert revisions[0].summary == "Fix bug"
+    assert revisions[0].author_name == "Jane Doe"
+    assert revisions[0].date == datetime(2024, 1, 3, 12, tzinfo=timezone.utc)
+
+
+def test_stream_log_missing_file(scratch_repo):
+    scratch_repo.commit("Initial commit", {"f": "1\n"})
+
+    assert list(stream_log(scratch_repo.repo, "missing", ["--", "missing"])) == []
+    with pytest.raises(FileNotFoundError):
+        list(stream_log(scratch_repo.repo, "missing", ["-L", "1,1:missing"]))
+
+
+def test_add_line_numbers_to_diff():
+    diff = "@@ -3,2 +3,3 @@ header\n c\n-old\n+new\n+more"
+
+    assert add_line_numbers_to_diff(diff).split("\n") == [
+        "@@ -3,2 +3,3 @@ header",
+        " c",
+        "    4: -old",
+        "    4: +new",
+        "    5: +more",
+    ]
+
+
+def test_parse_date():
+    assert parse_date("2024-02-29") == datetime(2024, 2, 29, tzinfo=timezone.utc)
+    assert parse_date("2024-1-5") == datetime(2024, 1, 5, tzinfo=timezone.utc)
+
+    for value in ("2024/02/29", "2024-02-30", "yesterday"):
+        with pytest.raises(typer.BadParameter):
+            parse_date(value)
+
+
+def test_add_line_numbers_to_diff_skips_file_headers():
+    diff = "diff --git a/f b/f\n--- a/f\n+++ b/f\n@@ -1 +1 @@\n-old\n+new"
+
+    assert add_line_numbers_to_diff(diff).split("\n") == [
+        "diff --git a/f b/f",
+        "--- a/f",
+        "+++ b/f",
+        "@@ -1 +1 @@",
+        "    1: -old",
+        "    1: +new",
+    ]
+
+
+def test_get_blame_item_does_not_share_identical_blobs(scratch_repo):
+    first = scratch_repo.commit("one", {"a.txt": "same\n"})
+    second = scratch_repo.commit("two", {"b.txt": "same\n"})
+    repo = scratch_repo.repo
+
+    assert get_blame_item(repo, "a.txt", 1).commit.hexsha == first
+    assert get_blame_item(repo, "b.txt", 1).commit.hexsha == second
+    assert get_file_blame(repo, "b.txt") == [(second, 1)]
+
+
+def test_get_blame_item_after_revert(scratch_repo):
+    first = scratch_repo.commit("one", {"a.txt": "old\n"})
+    repo = scratch_repo.repo
+    assert get_blame_item(repo, "a.txt", 1).commit.hexsha == first
+
+    scratch_repo.commit("two", {"a.txt": "new\n"})
+    reverted = scratch_repo.commit("three", {"a.txt": "old\n"})
+
+    assert get_blame_item(repo, "a.txt", 1).commit.hexsha == reverted
+
+
+@pytest.mark.parametrize("path", ["f", "./f", "dir/../f", "absolute"])
+@pytest.mark.parametrize(
+    "options", [{}, {"reverse": True}, {"first_parent": True}, {"limit": 2}, {"reverse": True, "limit": 2}]
+)
+def test_pygit2_walk_matches_git_log(scratch_repo, monkeypatch, options, path):
+    pytest.importorskip("pygit2")
+    git = scratch_repo.repo.git
+    scratch_repo.commit("base", {"f": "1\n", "g": "1\n"})
+    # A side branch that changes f, reverts it and is merged back leaves f TREESAME to the mainline parent
+    git.checkout("-q", "-b", "side")
+    scratch_repo.commit("side change", {"f": "2\n"})
+    scratch_repo.commit("side revert", {"f": "1\n"})
+    scratch_repo.commit("side other", {"g": "2\n"})
+    git.checkout("-q", "-")
+    scratch_repo.commit("main change", {"f": "3\n"})
+    scratch_repo.merge("side", "merge side")
+    # A merge whose only change to f comes from the merged-in branch is followed through that branch
+    git.checkout("-q", "-b", "topic")
+    scratch_repo.commit("topic change", {"f": "4\n"})
+    git.checkout("-q", "-")
+    scratch_repo.commit("main other", {"h": "1\n"})
+    scratch_repo.merge("topic", "merge topic")
+
+    if path == "absolute":
+        path = str(scratch_repo.path / "f")
+
+    def subjects():
+        return [commit.summary for commit in get_revisions(scratch_repo.repo, path, **options)]
+
+    with_pygit2 = subjects()
+    # Without pygit2 get_file_revisions falls back to git log
+    monkeypatch.setattr(history, "pygit2", None)
+    expected = subjects()
+    assert with_pygit2 == expected
+    assert expected and "side change" not in expected
+
+
+def test_get_log_filter_args():
+    after = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    before = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+    assert get_log_filter_args(None, None, None, None) == []
+    assert get_log_filter_args("jane", before, after, 5, first_parent=True) == [
+        "--first-parent",
+        "--max-count=5",
+        "--author=jane",
+        "--fixed-strings",
+        "--regexp-ignore-case",
+        f"--before=@{int(before.timestamp())}",
+        f"--after=@{int(after.timestamp())}",
+    ]
+    # git counts --max-count before reversing, so the limit is left to the caller
+    assert get_log_filter_args(None, None, None, 5, reverse=True) == ["--reverse"]
+
+
+@pytest.mark.parametrize("backend", ["git", "pygit2"])
+@pytest.mark.parametrize("line_number", [None, 1])
+def test_get_revisions_reverse_limit_keeps_oldest(scratch_repo, monkeypatch, backend, line_number):
+    if backend == "pygit2":
+        pytest.importorskip("pygit2")
+    else:
+        monkeypatch.setattr(history, "pygit2", None)
+    for number in range(1, 5):
+        scratch_repo.commit(f"change {number}", {"f": f"{number}\n"})
+
+    revisions = get_revisions(scratch_repo.repo, "f", line_number, reverse=True, limit=2)
+
+    assert [commit.summary for commit in revisions] == ["change 1", "change 2"]
+
+
+def test_history_reports_more_commits(scratch_repo, monkeypatch):
+    for number in range(1, 4):
+        scratch_repo.commit(f"change {number}", {"f": f"{number}\n"})
+    monkeypatch.chdir(scratch_repo.path)
+
+    result = CliRunner().invoke(history.app, ["--file", "f", "--limit", "2"])
+    assert "change 3" in result.output and "change 2" in result.output
+    assert "change 1" not in result.output
+    assert "Showing the first 2 commits" in result.output
+
+    result = CliRunner().invoke(history.app, ["--file", "f", "--limit", "3"])
+    assert "change 1" in result.output
+    assert "Showing the first" not in result.output
+
+
+def test_get_file_blame(scratch_repo):
+    first = scratch_repo.commit("one", {"f": "a\nb\nc\n"})
+    second = scratch_repo.commit("two", {"f": "x\na\nb\nc\n"})
+    third = scratch_repo.commit("three", {"f": "x\na\ny\nc\n"})
+
+    # Lines carried over from earlier commits keep their line numbers in those commits
+    assert get_file_blame(scratch_repo.repo, "f") == [(second, 1), (first, 1), (third, 3), (first, 3)]
+
+
+def test_is_file_unchanged_since(scratch_repo):
+    git = scratch_repo.repo.git
+    first = scratch_repo.commit("one", {"f": "1\n"})
+    unrelated = scratch_repo.commit("two", {"g": "1\n"})
+    changed = scratch_repo.commit("three", {"f": "2\n"})
+    git.checkout("-q", "-b", "side", first)
+    side = scratch_repo.commit("side", {"g": "2\n"})
+    repo = scratch_repo.repo
+
+    assert is_file_unchanged_since(repo, "f", first, first)
+    assert is_file_unchanged_since(repo, "f", first, unrelated)
+    assert not is_file_unchanged_since(repo, "f", first, changed)
+    # Not an ancestor, even though f is the same in both
+    assert not is_file_unchanged_since(repo, "f", side, unrelated)
+    assert not is_file_unchanged_since(repo, "f", "0" * 40, changed)
+
+
+def test_get_tree_path(scratch_repo):
+    repo = scratch_repo.repo
+
+    assert get_tree_path(repo, "./src/a.py") == "src/a.py"
+    assert get_tree_path(repo, str(scratch_repo.path / "src" / "a.py")) == "src/a.py"
+    for path in ("*.py", ":(glob)**/a.py", ".", "../a.py"):
+        assert get_tree_path(repo, path) is None
+
+
+def test_get_file_revisions_prefers_git_log_with_bloom_filters(scratch_repo, monkeypatch):
+    pytest.importorskip("pygit2")
+    scratch_repo.commit("one", {"f": "1\n"})
+    used = []
+
+    class RecordingIterator(history.Pygit2CommitIterator):
+        def __iter__(self):
+            used.append(self.file_path)
+            return super().__iter__()
+
+    monkeypatch.setattr(history, "Pygit2CommitIterator", RecordingIterator)
+
+    assert [commit.summary for commit in get_file_revisions(scratch_repo.repo, "f")] == ["one"]
+    assert used == ["f"]
+
+    scratch_repo.repo.git.commit_graph("write", "--reachable", "--changed-paths")
+    assert [commit.summary for commit in get_file_revisions(scratch_repo.repo, "f")] == ["one"]
+    assert used == ["f"]
+
+
+def test_get_blame_item_hit_runs_no_git(scratch_repo, monkeypatch):
+    first = scratch_repo.commit("one", {"a.txt": "same\n"})
+    repo = scratch_repo.repo
+    get_blame_item(repo, "a.txt", 1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("git was run on a cache hit")
+
+    monkeypatch.setattr(Git, "execute", fail)
+
+    assert get_blame_item(repo, "a.txt", 1).commit.hexsha == first
@@ -0,0 +1,57 @@
+from typer.testing import CliRunner
+
+import offal.pinned as pinned_module
+from offal.commands.pin import app as pin_app
+from offal.pinned import get_pinned_item, parse_pinned_file, remove_pinned_item, set_pinned_item, split_pin
+
+
+def test_split_pin():
+    assert split_pin("src/app.py#10") == ("src/app.py", 10)
+    assert split_pin("src/app.py") == ("src/app.py", None)
+    assert split_pin("notes#draft.md") == ("notes#draft.md", None)
+    assert split_pin("a#1#2") == ("a#1", 2)
+    for pin in ("a.py#²", "a.py#-3", "a.py# 3"):
+        assert split_pin(pin) == (pin, None)
+
+
+def test_parse_pinned_file(tmp_path):
+    pinned = tmp_path / ".pinned"
+    pinned.write_text("# comment\nfile = src/app.py#3\n\nbroken line\nother=a=b\n")
+
+    assert parse_pinned_file(pinned) == {"file": "src/app.py#3", "other": "a=b"}
+
+
+def test_set_and_remove_pinned_item(tmp_path, monkeypatch):
+    pinned = tmp_path / ".pinned"
+    pinned.write_text("file=a.py")
+    monkeypatch.setattr(pinned_module, "get_pinned_path", lambda: pinned)
+    pinned_module._load_pins.cache_clear()
+
+    set_pinned_item("line", "3")
+    assert pinned.read_text() == "file=a.py\nline=3\n"
+    assert get_pinned_item("line") == "3"
+
+    set_pinned_item("file", "b.py")
+    remove_pinned_item("line")
+    assert pinned.read_text() == "file=b.py\n"
+    assert get_pinned_item("line") is None
+
+    pinned_module._load_pins.cache_clear()
+
+
+def test_pin_command_agrees_with_split_pin(tmp_path, monkeypatch):
+    pinned = tmp_path / ".pinned"
+    monkeypatch.setattr(pinned_module, "get_pinned_path", lambda: pinned)
+    pinned_module._load_pins.cache_clear()
+    runner = CliRunner()
+
+    result = runner.invoke(pin_app, ["a.py#3"])
+    assert "at line 3" in result.output
+    assert get_pinned_item("file") == "a.py#3"
+
+    for pin in ("a.py#²", "a.py#-3"):
+        result = runner.invoke(pin_app, [pin])
+        assert "Invalid line number" in result.output
+        assert split_pin(get_pinned_item("file")) == (pin, None)
+
+    pinned_module._load_pins.cache_clear()
@@ -0,0 +1,44 @@
+from offal.commands.related import count_co_changed_files, is_line_modified, read_line_window
+
+
+def test_count_co_changed_files(scratch_repo):
+    scratch_repo.commit("one", {"f": "1\n", "a b.txt": "1\n", "dir/ü.txt": "1\n"})
+    scratch_repo.commit("two", {"f": "2\n", "a b.txt": "2\n"})
+    scratch_repo.commit("unrelated", {"g": "1\n"})
+    scratch_repo.commit("alone", {"f": "3\n"})
+
+    file_changes = count_co_changed_files(scratch_repo.repo, "f")
+
+    assert file_changes == {"a b.txt": 2, "dir/ü.txt": 1}
+
+
+def test_count_co_changed_files_without_history(scratch_repo):
+    scratch_repo.commit("one", {"f": "1\n"})
+
+    assert count_co_changed_files(scratch_repo.repo, "f") == {}
+    assert count_co_changed_files(scratch_repo.repo, "missing") is None
+
+
+def test_read_line_window():
+    data = "one\ntwo\nthree\nfour".encode()
+
+    assert read_line_window(data, 2, 3) == ["two", "three"]
+    assert read_line_window(data, 3, 10) == ["three", "four"]
+    assert read_line_window(data + b"\n", 4, 6) == ["four"]
+    assert read_line_window(data, 5, 6) == []
+    assert read_line_window("é\n".encode(), 1, 1) == ["é"]
+
+
+def test_is_line_modified(scratch_repo):
+    initial = scratch_repo.commit("one", {"f": "1\n2\n3\n4\n5\n"})
+    changed = scratch_repo.commit("two", {"f": "1\nTWO\n3\n4\nfive\nsix\n"})
+    deleted = scratch_repo.commit("three", {"f": "1\nTWO\n4\nfive\nsix\n"})
+    unrelated = scratch_repo.commit("four", {"g": "1\n"})
+    repo = scratch_repo.repo
+
+    assert is_line_modified(repo.commit(initial), "f", 3)
+    modified = [is_line_modified(repo.commit(changed), "f", line) for line in range(1, 7)]
+    assert modified == [False, True, False, False, True, True]
+    # A hunk that only deletes adds no lines in the new file
+    assert not any(is_line_modified(repo.commit(deleted), "f", line) for line in range(1, 6))
+    assert not is_line_modified(repo.commit(unrelated), "f", 1)